@@ -1,7 +1,15 @@
 from .application import WhatsappProcessor
 
+# Warm Lambda containers reuse the processor (and its parsed schema) across
+# invocations; only per-event state is refreshed.
+_processor = None
+
 
 def handler(event, context):
     """Lambda handler entry point."""
-    processor = WhatsappProcessor(**event)
-    processor.execute()
+    global _processor
+    if _processor is None:
+        _processor = WhatsappProcessor(**event)
+    else:
+        _processor.update_from_event(event)
+    _processor.execute()
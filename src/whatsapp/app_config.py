@@ -47,6 +47,12 @@ class WhatsappConfig(config.Schema):
     """
 
     def __init__(self):
+        # pydoover's Schema stores the element map on the class, which breaks
+        # constructing this schema more than once per process (e.g. the shared
+        # module-level instance plus a fresh one in tests or the config
+        # exporter). Give each instance its own map before adding elements.
+        self.__dict__["_Schema__element_map"] = {}
+
         # WhatsApp API configuration
         self.whatsapp_api_url = config.String(
             "WhatsApp API URL",
@@ -87,25 +93,36 @@ class WhatsappConfig(config.Schema):
             description="Prefix added to all alert messages"
         )
 
+    def reset(self):
+        """Restore every element to its default value.
+
+        The schema instance is reused across invocations (see application.py),
+        so values from a previous config must be cleared before reloading.
+        """
+        for element in vars(self).values():
+            if isinstance(element, config.ConfigElement):
+                element._value = element.default if element.default is not config.NotSet else None
+
+    # Config keys match attribute names one-to-one; new elements only need an
+    # entry here to be picked up by from_dict.
+    _FIELD_MAP = (
+        "whatsapp_api_url",
+        "whatsapp_phone_number_id",
+        "whatsapp_access_token",
+        "recipient_phone_numbers",
+        "thresholds",
+        "enabled",
+        "default_message_prefix",
+    )
+
     def from_dict(self, data: dict[str, Any]):
         """Load configuration from a dictionary (package_config)."""
         if not data:
             return
 
-        if "whatsapp_api_url" in data:
-            self.whatsapp_api_url._value = data["whatsapp_api_url"]
-        if "whatsapp_phone_number_id" in data:
-            self.whatsapp_phone_number_id._value = data["whatsapp_phone_number_id"]
-        if "whatsapp_access_token" in data:
-            self.whatsapp_access_token._value = data["whatsapp_access_token"]
-        if "recipient_phone_numbers" in data:
-            self.recipient_phone_numbers._value = data["recipient_phone_numbers"]
-        if "thresholds" in data:
-            self.thresholds._value = data["thresholds"]
-        if "enabled" in data:
-            self.enabled._value = data["enabled"]
-        if "default_message_prefix" in data:
-            self.default_message_prefix._value = data["default_message_prefix"]
+        for key in self._FIELD_MAP:
+            if key in data:
+                getattr(self, key)._value = data[key]
 
 
 def export():
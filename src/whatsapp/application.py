@@ -1,16 +1,89 @@
+import asyncio
 import logging
-import json
+import operator
+import string
 from datetime import datetime, timezone
 from typing import Any
-import urllib.request
-import urllib.error
 
+import httpx
+
+try:
+    import orjson
+
+    def _json_dumps(obj: Any) -> bytes:
+        return orjson.dumps(obj)
+
+    _json_loads = orjson.loads
+except ImportError:
+    # Fall back to the stdlib where the orjson wheel isn't available.
+    import json
+
+    def _json_dumps(obj: Any) -> bytes:
+        return json.dumps(obj, separators=(",", ":")).encode("utf-8")
+
+    _json_loads = json.loads
+
+from pydoover.cloud.api import Client, Message
 from pydoover.cloud.processor import ProcessorBase
+from pydoover.cloud.processor.base import LogHandler
+from pydoover.ui import UIManager
 
 from .app_config import WhatsappConfig
 
 log = logging.getLogger()
 
+# All Graph API calls hit the same host, so a keep-alive pool lets sends
+# reuse TLS connections instead of paying a full handshake per recipient.
+# Transient connection errors are retried by the transport; 429/5xx responses
+# are retried with backoff in _send_to_recipient.
+_CLIENT_LIMITS = httpx.Limits(max_connections=32, max_keepalive_connections=16)
+
+_RETRY_STATUS = frozenset({429, 500, 502, 503, 504})
+_RETRY_ATTEMPTS = 3
+_RETRY_BACKOFF = 0.2
+
+# One event loop and client for the life of the process, so alerts within an
+# invocation - and warm invocations reusing this module - share the connection
+# pool instead of rebuilding a loop, transport and TLS session per alert.
+_LOOP = asyncio.new_event_loop()
+_client: httpx.AsyncClient | None = None
+
+
+def _get_client() -> httpx.AsyncClient:
+    global _client
+    if _client is None:
+        # The limits must go to the transport: httpx ignores limits= when an
+        # explicit transport is supplied.
+        _client = httpx.AsyncClient(
+            transport=httpx.AsyncHTTPTransport(retries=3, limits=_CLIENT_LIMITS),
+            timeout=30,
+        )
+    return _client
+
+# Comparison operators mapped to their C-implemented builtins, so a threshold
+# check is a single dict lookup and C call rather than a fresh lambda per call.
+_OPS = {
+    ">": operator.gt,
+    "<": operator.lt,
+    ">=": operator.ge,
+    "<=": operator.le,
+    "==": operator.eq,
+    "!=": operator.ne,
+}
+
+# Strips formatting characters from phone numbers in a single pass.
+_PHONE_STRIP = str.maketrans("", "", "+ -")
+
+# Used to parse message templates once at config load; see _prepare_thresholds.
+_FORMATTER = string.Formatter()
+
+_DEFAULT_TEMPLATE = "Alert: {tag_name} is {value}"
+_DEFAULT_PLAN = list(_FORMATTER.parse(_DEFAULT_TEMPLATE))
+
+# Building the schema element tree is comparatively expensive; construct it
+# once at import so warm starts only reload values into it.
+_SCHEMA = WhatsappConfig()
+
 
 class WhatsappProcessor(ProcessorBase):
     """WhatsApp processor for sending threshold-based alerts.
@@ -31,12 +104,125 @@ class WhatsappProcessor(ProcessorBase):
         """Called once per invocation before processing."""
         log.info("WhatsApp processor setup complete")
 
-        # Parse the package config into our config schema
-        self.config = WhatsappConfig()
+        # Parse the package config into the shared config schema
+        self.config = _SCHEMA
+        self.config.reset()
         self.config.from_dict(self.package_config)
+        self._prepare_thresholds()
+        self._prepare_recipients()
+
+    def _prepare_recipients(self):
+        """Parse, validate and pre-encode the recipient list once at config load.
+
+        Recipients don't change between alerts, so the fixed part of each
+        per-recipient JSON payload is encoded here; sending only splices the
+        escaped message body into the prebuilt bytes (see `_send_all`).
+        """
+        recipients = self.config.recipient_phone_numbers._value or ""
+        prepared = []
+        for raw in recipients.split(","):
+            phone = raw.strip().translate(_PHONE_STRIP)
+            if not phone:
+                continue
+            if not phone.isdigit():
+                log.warning(f"Skipping invalid recipient phone number: {raw.strip()!r}")
+                continue
+
+            # Everything up to and including the opening quote of the body
+            # value; the trailing '"}}' is re-appended at send time.
+            payload_prefix = _json_dumps({
+                "messaging_product": "whatsapp",
+                "to": phone,
+                "type": "text",
+                "text": {"body": ""},
+            })[:-3]
+            prepared.append((phone, payload_prefix))
+
+        self._recipients = tuple(prepared)
+
+    def _prepare_thresholds(self):
+        """Resolve per-threshold state once at config load.
+
+        Validates each threshold's operator up front and stores the resolved
+        comparison builtin, the split tag-name key path, the cooldown period
+        in seconds and the cooldown key on the threshold record, so the
+        per-message hot path avoids recomputing any of them. Thresholds are
+        indexed by the root key of their tag path so `_check_thresholds` only
+        evaluates the ones whose root actually appears in a message.
+        """
+        self._thresholds_by_root: dict[str, list[dict[str, Any]]] = {}
+        for threshold_config in self.config.thresholds._value or []:
+            operator_str = threshold_config.get("operator", ">")
+            if operator_str not in _OPS:
+                log.warning(f"Unknown operator '{operator_str}' in threshold config, defaulting to '>'")
+            threshold_config["_resolved_op"] = _OPS.get(operator_str, operator.gt)
+
+            tag_name = threshold_config.get("tag_name")
+            threshold_value = threshold_config.get("threshold_value", 0.0)
+            threshold_config["_key_path"] = tuple(tag_name.split(".")) if tag_name else ()
+            threshold_config["_cooldown_seconds"] = threshold_config.get("cooldown_minutes", 15) * 60
+            threshold_config["_cooldown_key"] = f"{tag_name}_{operator_str}_{threshold_value}"
+
+            # Parse the message template into (literal, field, ...) tuples so
+            # rendering an alert doesn't re-parse the format string. A
+            # malformed template only costs that threshold its custom message,
+            # not alerting as a whole.
+            template = threshold_config.get("message_template", _DEFAULT_TEMPLATE)
+            try:
+                threshold_config["_template_plan"] = list(_FORMATTER.parse(template))
+            except ValueError as e:
+                log.warning(f"Invalid message template {template!r} ({e}), using default")
+                threshold_config["_template_plan"] = _DEFAULT_PLAN
+
+            if threshold_config["_key_path"]:
+                root_key = threshold_config["_key_path"][0]
+                self._thresholds_by_root.setdefault(root_key, []).append(threshold_config)
+
+    def update_from_event(self, event: dict[str, Any]):
+        """Refresh per-invocation state on a reused processor instance.
+
+        Warm Lambda containers keep this instance alive between invocations
+        (see the handler in `__init__.py`); only the fields that change per
+        event are rebuilt, leaving the schema tree intact.
+        """
+        # Swap the log handler so a warm container doesn't republish logs
+        # captured during previous invocations.
+        log.removeHandler(self._log_handler)
+        self._log_handler = LogHandler()
+        log.addHandler(self._log_handler)
+
+        self.app_key = event.get("app_key", "app")
+        self.access_token = event["access_token"]
+        self.agent_id = event["agent_id"]
+        self.log_channel_id = event["log_channel"]
+        self.task_id = event["task_id"]
+
+        # The temporary access token differs per invocation, so the API
+        # client has to be rebuilt; it is cheap next to the schema tree.
+        self.api = Client(
+            token=self.access_token,
+            base_url=event["api_endpoint"],
+            agent_id=self.agent_id,
+        )
+        self.ui_manager = UIManager(self.app_key, self.api)
+
+        self.deployment_config = event["agent_settings"].get("deployment_config", {})
+        self.package_config = event.get("package_config", {})
+
+        msg_obj = event.get("msg_obj")
+        if msg_obj is not None:
+            self.message = Message(client=self.api, data=msg_obj, channel_id=None)
+        else:
+            self.message = None
 
     def process(self):
         """Process incoming messages and check for threshold violations."""
+        # Capture the invocation time once; cooldown checks, cooldown stamps
+        # and sent-tracking all share it rather than re-querying the clock.
+        self._now = datetime.now(timezone.utc)
+        self._now_iso = self._now.isoformat()
+        self._now_ts = self._now.timestamp()
+
         if not self._is_enabled():
             log.info("WhatsApp alerts are disabled")
             return
@@ -64,72 +250,87 @@ class WhatsappProcessor(ProcessorBase):
     def _handle_schedule_or_manual(self):
         """Handle scheduled or manual invocations."""
         # Update last run timestamp
-        self._set_tag("last_scheduled_run", datetime.now(timezone.utc).isoformat())
+        self._set_tag("last_scheduled_run", self._now_iso)
 
     def _check_thresholds(self, data: dict[str, Any]):
         """Check data against configured thresholds and send alerts if violated."""
-        thresholds = self.config.thresholds.value
-        if not thresholds:
-            log.debug("No thresholds configured")
+        # Guard once here so non-dict or empty payloads don't walk the
+        # threshold list, and an empty threshold set doesn't fetch cooldowns.
+        if not isinstance(data, dict) or not data:
             return
 
-        # Get alert cooldown state
-        cooldown_state = self._get_tag("alert_cooldowns", {})
-
-        for threshold_config in thresholds:
-            tag_name = threshold_config.get("tag_name")
-            if not tag_name:
-                continue
-
-            # Check if the tag exists in the data
-            value = self._extract_value(data, tag_name)
-            if value is None:
-                continue
+        if not self._thresholds_by_root:
+            log.debug("No thresholds configured")
+            return
 
-            operator = threshold_config.get("operator", ">")
-            threshold_value = threshold_config.get("threshold_value", 0.0)
+        # Most messages violate nothing, so defer the cooldown-state channel
+        # fetch until the first violation actually needs it, and write it back
+        # at most once per invocation.
+        cooldown_state = None
+        cooldown_dirty = False
 
-            # Check if threshold is violated
-            if self._is_threshold_violated(value, operator, threshold_value):
-                # Check cooldown
-                cooldown_key = f"{tag_name}_{operator}_{threshold_value}"
-                cooldown_minutes = threshold_config.get("cooldown_minutes", 15)
-
-                if self._is_in_cooldown(cooldown_state, cooldown_key, cooldown_minutes):
-                    log.info(f"Threshold alert for '{tag_name}' is in cooldown, skipping")
-                    continue
-
-                # Format and send the alert message
-                message = self._format_message(
-                    threshold_config.get("message_template", "Alert: {tag_name} is {value}"),
-                    tag_name=tag_name,
-                    value=value,
-                    threshold=threshold_value,
-                    operator=operator,
-                    device_name=self.agent_id
-                )
-
-                self._send_whatsapp_message(message)
-
-                # Update cooldown state
-                cooldown_state[cooldown_key] = datetime.now(timezone.utc).isoformat()
+        # Only evaluate thresholds whose root key actually appears in this
+        # message, rather than walking every configured threshold.
+        try:
+            for root_key in data:
+                for threshold_config in self._thresholds_by_root.get(root_key, ()):
+                    # Check if the tag exists in the data
+                    value = self._extract_value(data, threshold_config["_key_path"])
+                    if value is None:
+                        continue
+
+                    tag_name = threshold_config["tag_name"]
+                    operator_str = threshold_config.get("operator", ">")
+                    threshold_value = threshold_config.get("threshold_value", 0.0)
+
+                    # Check if threshold is violated
+                    if threshold_config["_resolved_op"](value, threshold_value):
+                        # Check cooldown
+                        if cooldown_state is None:
+                            cooldown_state = self._load_cooldown_state()
+
+                        cooldown_key = threshold_config["_cooldown_key"]
+
+                        if self._is_in_cooldown(cooldown_state, cooldown_key, threshold_config["_cooldown_seconds"]):
+                            log.info(f"Threshold alert for '{tag_name}' is in cooldown, skipping")
+                            continue
+
+                        # Format and send the alert message
+                        message = self._format_message(
+                            threshold_config["_template_plan"],
+                            tag_name=tag_name,
+                            value=value,
+                            threshold=threshold_value,
+                            operator=operator_str,
+                            device_name=self.agent_id
+                        )
+
+                        self._send_whatsapp_message(message)
+
+                        # Update cooldown state
+                        cooldown_state[cooldown_key] = self._now_ts
+                        cooldown_dirty = True
+
+                        log.info(f"Sent WhatsApp alert for threshold violation: {tag_name} {operator_str} {threshold_value}")
+        finally:
+            # One channel write covers every alert sent this invocation; do it
+            # even if a later threshold raised, so sent alerts keep their
+            # cooldown stamps and don't re-fire on every message.
+            if cooldown_dirty:
                 self._set_tag("alert_cooldowns", cooldown_state)
 
-                log.info(f"Sent WhatsApp alert for threshold violation: {tag_name} {operator} {threshold_value}")
+    def _extract_value(self, data: dict[str, Any], key_path: tuple[str, ...]) -> float | None:
+        """Extract a numeric value from nested data using a precomputed key path.
 
-    def _extract_value(self, data: dict[str, Any], tag_name: str) -> float | None:
-        """Extract a numeric value from nested data using dot notation."""
-        if not isinstance(data, dict):
-            return None
-
-        # Support dot notation for nested values (e.g., "sensors.temperature")
-        keys = tag_name.split(".")
+        Key paths are split from dot notation (e.g., "sensors.temperature")
+        once at config load; see `_prepare_thresholds`.
+        """
         current = data
-
-        for key in keys:
-            if isinstance(current, dict) and key in current:
-                current = current[key]
-            else:
+        for key in key_path:
+            if not isinstance(current, dict):
+                return None
+            current = current.get(key)
+            if current is None:
                 return None
 
         # Try to convert to float
@@ -138,40 +339,54 @@ class WhatsappProcessor(ProcessorBase):
         except (TypeError, ValueError):
             return None
 
-    def _is_threshold_violated(self, value: float, operator: str, threshold: float) -> bool:
+    def _is_threshold_violated(self, value: float, operator_str: str, threshold: float) -> bool:
         """Check if a value violates the threshold based on the operator."""
-        operators = {
-            ">": lambda v, t: v > t,
-            "<": lambda v, t: v < t,
-            ">=": lambda v, t: v >= t,
-            "<=": lambda v, t: v <= t,
-            "==": lambda v, t: v == t,
-            "!=": lambda v, t: v != t,
-        }
+        return _OPS.get(operator_str, operator.gt)(value, threshold)
 
-        check_func = operators.get(operator, operators[">"])
-        return check_func(value, threshold)
+    def _load_cooldown_state(self) -> dict[str, float]:
+        """Fetch the alert cooldown state tag.
 
-    def _is_in_cooldown(self, cooldown_state: dict, cooldown_key: str, cooldown_minutes: int) -> bool:
+        Stamps are stored as epoch seconds; any legacy ISO strings from older
+        deployments are migrated in place on load.
+        """
+        cooldown_state = self._get_tag("alert_cooldowns", {})
+        for key, stamp in cooldown_state.items():
+            if isinstance(stamp, (int, float)):
+                continue
+            try:
+                cooldown_state[key] = datetime.fromisoformat(stamp).timestamp()
+            except (TypeError, ValueError):
+                # Anything unparseable is treated as expired, matching the
+                # old behaviour of alerting when a stamp couldn't be read.
+                cooldown_state[key] = 0.0
+        return cooldown_state
+
+    def _is_in_cooldown(self, cooldown_state: dict[str, float], cooldown_key: str, cooldown_seconds: int) -> bool:
         """Check if an alert is still in cooldown period."""
-        if cooldown_key not in cooldown_state:
-            return False
+        return (self._now_ts - cooldown_state.get(cooldown_key, 0.0)) < cooldown_seconds
 
-        try:
-            last_alert_time = datetime.fromisoformat(cooldown_state[cooldown_key])
-            elapsed = datetime.now(timezone.utc) - last_alert_time
-            return elapsed.total_seconds() < cooldown_minutes * 60
-        except (ValueError, TypeError):
-            return False
-
-    def _format_message(self, template: str, **kwargs) -> str:
-        """Format a message template with the provided values."""
+    def _format_message(self, template_plan: list[tuple], **kwargs) -> str:
+        """Render a pre-parsed message template with the provided values."""
         prefix = self.config.default_message_prefix.value or ""
         try:
-            message = template.format(**kwargs)
+            parts = []
+            for literal, field_name, format_spec, conversion in template_plan:
+                parts.append(literal)
+                if field_name is not None:
+                    part = kwargs[field_name]
+                    if conversion == "s":
+                        part = str(part)
+                    elif conversion == "r":
+                        part = repr(part)
+                    elif conversion == "a":
+                        part = ascii(part)
+                    parts.append(format(part, format_spec) if format_spec else str(part))
+            message = "".join(parts)
             return f"{prefix} {message}".strip()
-        except KeyError as e:
-            log.warning(f"Message template missing key: {e}")
+        except (KeyError, ValueError) as e:
+            # Missing field or a spec format() can't apply (e.g. nested
+            # specs); degrade to the fallback message rather than aborting.
+            log.warning(f"Message template failed to render: {e}")
             return f"{prefix} Alert: {kwargs.get('tag_name', 'Unknown')} = {kwargs.get('value', 'N/A')}"
 
     def _get_tag(self, tag_name: str, default: Any = None) -> Any:
@@ -198,54 +413,70 @@ class WhatsappProcessor(ProcessorBase):
         """Send a WhatsApp message to all configured recipients."""
         phone_number_id = self.config.whatsapp_phone_number_id.value
         access_token = self.config.whatsapp_access_token.value
-        recipients = self.config.recipient_phone_numbers.value
         api_url = self.config.whatsapp_api_url.value
 
-        if not all([phone_number_id, access_token, recipients]):
+        if not all([phone_number_id, access_token, self._recipients]):
             log.error("WhatsApp configuration incomplete - missing phone_number_id, access_token, or recipients")
             return
 
-        # Parse comma-separated phone numbers
-        phone_numbers = [p.strip() for p in recipients.split(",") if p.strip()]
-
-        for phone_number in phone_numbers:
-            self._send_to_recipient(api_url, phone_number_id, access_token, phone_number, message)
-
-    def _send_to_recipient(self, api_url: str, phone_number_id: str, access_token: str, recipient: str, message: str):
-        """Send a WhatsApp message to a single recipient."""
+        # Everything except the "to" field is identical across recipients, so
+        # build the URL, headers and escaped message body once per alert; the
+        # per-recipient payload bytes were prebuilt at config load.
         url = f"{api_url}/{phone_number_id}/messages"
-
-        payload = {
-            "messaging_product": "whatsapp",
-            "to": recipient.replace("+", "").replace(" ", "").replace("-", ""),
-            "type": "text",
-            "text": {
-                "body": message
-            }
-        }
-
         headers = {
             "Authorization": f"Bearer {access_token}",
-            "Content-Type": "application/json"
+            "Content-Type": "application/json",
         }
-
+        body_bytes = _json_dumps(message)[1:-1]
+
+        successes = _LOOP.run_until_complete(self._send_all(url, headers, body_bytes))
+
+        # Update the sent counters once per alert rather than per recipient,
+        # so the fan-out costs two channel writes instead of 3N roundtrips.
+        if successes:
+            sent_count = self._get_tag("messages_sent_count", 0)
+            self._set_tag("messages_sent_count", sent_count + successes)
+            self._set_tag("last_message_sent", self._now_iso)
+
+    async def _send_all(self, url: str, headers: dict[str, str], body_bytes: bytes) -> int:
+        """Fan out a message to all recipients concurrently.
+
+        Each Graph API call is independent, so sending them concurrently
+        collapses total latency to roughly that of a single call. The payload
+        bytes are spliced from the prebuilt per-recipient prefix and the
+        escaped message body. Returns the number of successful sends.
+        """
+        client = _get_client()
+        results = await asyncio.gather(
+            *[
+                self._send_to_recipient(client, url, headers, phone, payload_prefix + body_bytes + b'"}}')
+                for phone, payload_prefix in self._recipients
+            ],
+            return_exceptions=True,
+        )
+
+        return sum(1 for result in results if result is True)
+
+    async def _send_to_recipient(self, client: httpx.AsyncClient, url: str, headers: dict[str, str], recipient: str, payload_bytes: bytes) -> bool:
+        """Send a WhatsApp message to a single recipient. Returns True on success."""
         try:
-            data = json.dumps(payload).encode("utf-8")
-            request = urllib.request.Request(url, data=data, headers=headers, method="POST")
-
-            with urllib.request.urlopen(request, timeout=30) as response:
-                response_data = json.loads(response.read().decode("utf-8"))
-                log.info(f"WhatsApp message sent to {recipient}: {response_data}")
-
-                # Track sent messages
-                sent_count = self._get_tag("messages_sent_count", 0)
-                self._set_tag("messages_sent_count", sent_count + 1)
-                self._set_tag("last_message_sent", datetime.now(timezone.utc).isoformat())
-
-        except urllib.error.HTTPError as e:
-            error_body = e.read().decode("utf-8") if e.fp else "No response body"
-            log.error(f"Failed to send WhatsApp message to {recipient}: HTTP {e.code} - {error_body}")
-        except urllib.error.URLError as e:
-            log.error(f"Failed to send WhatsApp message to {recipient}: {e.reason}")
+            # Retry rate limits and transient server errors with backoff;
+            # the transport below only retries connection failures.
+            for attempt in range(_RETRY_ATTEMPTS + 1):
+                response = await client.post(url, content=payload_bytes, headers=headers)
+                if response.status_code not in _RETRY_STATUS or attempt == _RETRY_ATTEMPTS:
+                    break
+                await asyncio.sleep(_RETRY_BACKOFF * (2 ** attempt))
+
+            response.raise_for_status()
+            log.info(f"WhatsApp message sent to {recipient}: {_json_loads(response.content)}")
+            return True
+
+        except httpx.HTTPStatusError as e:
+            log.error(f"Failed to send WhatsApp message to {recipient}: HTTP {e.response.status_code} - {e.response.text}")
+        except httpx.HTTPError as e:
+            log.error(f"Failed to send WhatsApp message to {recipient}: {e}")
         except Exception as e:
             log.error(f"Unexpected error sending WhatsApp message to {recipient}: {e}")
+
+        return False